@@ -1,9 +1,13 @@
 # pylint: disable=C0114
 import sys
-from logging import info
+from asyncio import sleep
+from time import time
+from logging import info, warning
 from argparse import ArgumentParser, Action
-from aiohttp import ClientSession
+from pathlib import Path
+from aiohttp import ClientSession, ClientTimeout, ClientError, ClientConnectorError
 from aiohttp.formdata import FormData
+from totp import gen_otp_from_secret_file, TIME_STEP
 
 # Messages to display in the log
 REQUEST_MESSAGES = {
@@ -16,18 +20,98 @@ REQUEST_MESSAGES = {
         'default': 'Unable to generate the print version. HTTP status: {status}'
     }
 }
+# Attempts per request and the delay before the first retry in seconds,
+# doubled with each attempt
+RETRY_ATTEMPTS = 4
+RETRY_DELAY = 2
+# Statuses meaning that the request hasn't reached the mailer:
+# a proxy in front of it reports it as down or overloaded
+UNAVAILABLE_STATUSES = (502, 503, 504)
+# The size of the print version chunks written to the output file, in bytes
+PRINT_CHUNK_SIZE = 64 * 1024
+# Seconds between the campaign state checks
+POLL_INTERVAL = 10
+# The campaign states after which there's nothing to wait for
+FINAL_STATES = ('done', 'failed')
 
-async def prepare_request(data_path, totp):
+def create_session(timeout: float):
+    """
+    Returns:
+        (ClientSession): a session, keeping the connections alive between the requests
+
+    Args:
+        timeout (float): the total timeout of a request in seconds
+    """
+    return ClientSession(timeout=ClientTimeout(total=timeout))
+
+async def prepare_request(data_file, totp, fields=None):
     """
     Prepares the FormData instance with a TOTP key
     for the request.
+
+    Args:
+        data_file (file): the data file, streamed with the request
+        fields (dict): optional form fields, the empty ones are skipped
     """
     data = FormData()
     data.add_field('password', totp)
-    with open(data_path, 'rb') as template_data:
-        data.add_field('template_data', template_data.read())
+    for name, value in (fields or {}).items():
+        if value:
+            data.add_field(name, value)
+    data.add_field('template_data', data_file, filename=Path(data_file.name).name)
     return data
 
+# pylint: disable=R0913,R0914
+async def post_with_retries(session, addr: str, data_path: str, secret_path: str,
+                            *, fields=None, idempotent=False, read_response=None):
+    """
+    Sends the data with a TOTP key, retrying with a backoff.
+
+    Sending the mails isn't idempotent: a retry after the mailer got the request
+    could send the mails twice. Such requests are only retried if the connection
+    couldn't be made or a proxy reports the mailer as unavailable.
+    The idempotent requests are also retried on any 5xx status and connection error.
+
+    The server accepts each key once, so a retry of a request which could have
+    reached it waits for the next time step to send a new key.
+
+    Args:
+        read_response (coroutine function): reads a successful response instead
+            of loading its text, accepting the response; retried with the request
+
+    Returns:
+        (tuple): HTTP status and the response text or the read_response result
+    """
+    retry_errors = (ClientError, TimeoutError) if idempotent else (ClientConnectorError,)
+    for attempt in range(RETRY_ATTEMPTS):
+        last_attempt = attempt == RETRY_ATTEMPTS - 1
+        # A fresh key, as the previous one may have expired or been used
+        step = int(time()) // TIME_STEP
+        totp = gen_otp_from_secret_file(secret_path)
+        reached = True
+        try:
+            with open(data_path, 'rb') as data_file:
+                data = await prepare_request(data_file, totp, fields)
+                async with session.post(addr, data=data) as req:
+                    retry = req.status in UNAVAILABLE_STATUSES or \
+                            (idempotent and req.status >= 500)
+                    if req.status == 200 and read_response:
+                        return req.status, await read_response(req)
+                    if not retry or last_attempt:
+                        return req.status, await req.text()
+                    warning(f'Request to {addr} failed with HTTP status {req.status}')
+        except retry_errors as err:
+            if last_attempt:
+                raise
+            warning(f'Request to {addr} failed: {err!r}')
+            reached = not isinstance(err, ClientConnectorError)
+        delay = RETRY_DELAY * 2 ** attempt
+        if reached:
+            delay = max(delay, (step + 1) * TIME_STEP - time())
+        await sleep(delay)
+    # Unreachable, the last attempt either returns or raises
+    return None, ''
+
 async def log_request(mode, status):
     """
     Log the request result,
@@ -38,27 +122,105 @@ async def log_request(mode, status):
     result = result.format(status=status)
     info(result)
 
-async def perform_mail_request(addr: str, data_path: str, totp: str):
+async def wait_for_campaign(session, status_addr: str):
+    """
+    Poll the campaign state until it's finished.
+
+    Returns:
+        (dict / None): the final campaign state, None if it's unknown to the server
+    """
+    while True:
+        try:
+            async with session.get(status_addr) as req:
+                if req.status == 404:
+                    warning('The campaign is unknown to the server')
+                    return None
+                state = await req.json()
+                info(f'Campaign state: {state["state"]}')
+                if state['state'] in FINAL_STATES:
+                    return state
+        except (ClientError, TimeoutError) as err:
+            warning(f'Unable to check the campaign state: {err!r}')
+        await sleep(POLL_INTERVAL)
+
+# pylint: disable=R0913
+async def perform_mail_request(session, addr: str, data_path: str, secret_path: str,
+                               *, fields=None, wait=False):
     """
     Sends a request for mailing.
+
+    Args:
+        fields (dict): optional "send_at" and "window_end" delivery times,
+                       or the "dry_run" mailbox format
+        wait (bool): poll the scheduled campaign state until it's finished
     """
-    async with ClientSession() as session:
-        data = await prepare_request(data_path, totp)
-        req = await session.post(addr, data=data)
-        await log_request('email', req.status)
+    status, text = await post_with_retries(
+        session, addr, data_path, secret_path, fields=fields
+    )
+    await log_request('email', status)
+    if fields and fields.get('dry_run'):
+        # The dry run reports its timings
+        info(text)
+    if wait and status == 200 and text.startswith('Scheduled: '):
+        campaign_id = text.removeprefix('Scheduled: ')
+        base_addr = addr.removesuffix('/schedule')
+        await wait_for_campaign(session, f'{base_addr}/campaigns/{campaign_id}')
 
-async def perform_print_request(addr: str, data_path: str, totp: str):
+async def save_print_request(session, addr: str, data_path: str, secret_path: str,
+                             output_path: str):
     """
-    Sends a request for a print version.
+    Sends a request for a print version and streams it to the output file.
+    The response is decompressed on the fly, so the memory use is bounded by the chunk size.
     """
-    result = ''
-    async with ClientSession() as session:
-        data = await prepare_request(data_path, totp)
-        req = await session.post(addr, data=data)
-        await log_request('print', req.status)
-        if req.status == 200:
-            result = await req.text()
-    return result
+
+    async def save_response(req):
+        # Truncated on a retry, so an interrupted attempt leaves no partial output
+        with open(output_path, 'wb') as output_file:
+            async for chunk in req.content.iter_chunked(PRINT_CHUNK_SIZE):
+                output_file.write(chunk)
+
+    status, _ = await post_with_retries(
+        session, addr, data_path, secret_path,
+        idempotent=True, read_response=save_response
+    )
+    await log_request('print', status)
+    if status != 200:
+        # Keep the output file in place, as the CI jobs expect it
+        with open(output_path, 'w', encoding='utf-8'):
+            pass
+
+def get_mail_fields(args):
+    """
+    Returns:
+        (dict): the optional mailing form fields from the arguments
+    """
+    return {
+        'send_at': args.send_at,
+        'window_end': args.window_end,
+        'dry_run': args.dry_run
+    }
+
+def get_print_route(value: str):
+    """
+    Returns:
+        (str): the print version route for a server address
+    """
+    return f'{get_base_route(value)}/generate_print'
+
+def get_mail_route(value: str):
+    """
+    Returns:
+        (str): the mailing route for a server address
+    """
+    return f'{get_base_route(value)}/schedule'
+
+def get_base_route(value: str):
+    """
+    Returns:
+        (str): the server address without the API routes
+    """
+    value = value.rstrip('/')
+    return value.removesuffix('/generate_print').removesuffix('/schedule')
 
 class FixPrintRouteAction(Action):
     """
@@ -66,8 +228,7 @@ class FixPrintRouteAction(Action):
     """
 
     def __call__(self, parser, args, value, option_string=None):
-        value = value.removesuffix('/generate_print').removesuffix('/generate_print/')
-        setattr(args, self.dest, f'{value}/generate_print')
+        setattr(args, self.dest, get_print_route(value))
 
 class FixMailRouteAction(Action):
     """
@@ -75,15 +236,22 @@ class FixMailRouteAction(Action):
     """
 
     def __call__(self, parser, args, value, option_string=None):
-        value = value.removesuffix('/schedule').removesuffix('/schedule/')
-        setattr(args, self.dest, f'{value}/schedule')
+        setattr(args, self.dest, get_mail_route(value))
+
+class FixBaseRouteAction(Action):
+    """
+    Fixes the route, removing the API parts.
+    """
+
+    def __call__(self, parser, args, value, option_string=None):
+        setattr(args, self.dest, get_base_route(value))
 
 def get_arguments(mode: str):
     """
     Retrieves the Argparse arguments.
 
     Args:
-        mode (str): (mail or print)
+        mode (str): (mail, print or release, which is both)
     """
     fix_route_action = None
     if mode == 'mail':
@@ -92,6 +260,9 @@ def get_arguments(mode: str):
     elif mode == 'print':
         description = 'Print version requester utility'
         fix_route_action = FixPrintRouteAction
+    elif mode == 'release':
+        description = 'Mail and print version requester utility'
+        fix_route_action = FixBaseRouteAction
     else:
         # Fail early as it's a potential code error
         description = 'Incorrect argument configuration mode detected'
@@ -116,7 +287,37 @@ def get_arguments(mode: str):
         help="Path to the data file",
         required=True
     )
-    if mode == 'print':
+    parser.add_argument(
+        '-T',
+        "--timeout",
+        help="Total timeout of a request in seconds",
+        type=float,
+        default=300
+    )
+    if mode in ('mail', 'release'):
+        parser.add_argument(
+            '-t',
+            "--send_at",
+            help="ISO 8601 time to start sending at, UTC unless the offset is set"
+        )
+        parser.add_argument(
+            '-w',
+            "--window_end",
+            help="ISO 8601 time to spread the mails until, UTC unless the offset is set"
+        )
+        parser.add_argument(
+            '-n',
+            "--dry_run",
+            help="Write the mails to a server-side mailbox instead of sending them",
+            choices=['mbox', 'maildir']
+        )
+        parser.add_argument(
+            '-W',
+            "--wait",
+            help="Wait until a scheduled campaign is sent",
+            action='store_true'
+        )
+    if mode in ('print', 'release'):
         parser.add_argument(
             '-o',
             "--output_path",
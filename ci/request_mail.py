@@ -3,18 +3,24 @@ Mailer request utility to be integrated in CI.
 """
 
 from asyncio import run
-from totp import gen_otp_from_secret_file
-from common_req import perform_mail_request, get_arguments
+from logging import basicConfig as basicLoggingConfig, INFO as LOGGING_INFO
+from common_req import perform_mail_request, get_arguments, get_mail_fields, \
+                       create_session
 
 async def main():
     """
-    Load arguments, prepare a one-time pass, perform a request for CI.
+    Load arguments, perform a request for CI.
     """
 
     args = get_arguments('mail')
-    totp = gen_otp_from_secret_file(args.secret_path)
-    await perform_mail_request(args.address, args.data_path, totp)
+    async with create_session(args.timeout) as session:
+        await perform_mail_request(
+            session, args.address, args.data_path, args.secret_path,
+            fields=get_mail_fields(args),
+            wait=args.wait
+        )
 
 
 if __name__ == '__main__':
+    basicLoggingConfig(level=LOGGING_INFO)
     run(main())
@@ -3,21 +3,20 @@ Print version request utility to be integrated in CI.
 """
 
 from asyncio import run
-from totp import gen_otp_from_secret_file
-from common_req import perform_print_request, get_arguments
+from logging import basicConfig as basicLoggingConfig, INFO as LOGGING_INFO
+from common_req import save_print_request, get_arguments, create_session
 
 async def main():
     """
-    Load arguments, prepare a one-time pass, perform a request for CI.
+    Load arguments, perform a request for CI.
     """
 
     args = get_arguments('print')
-    totp = gen_otp_from_secret_file(args.secret_path)
-    html_render_str = await perform_print_request(
-        args.address, args.data_path, totp
-    )
-    with open(args.output_path, 'w', encoding='utf-8') as output_file:
-        output_file.write(html_render_str)
+    async with create_session(args.timeout) as session:
+        await save_print_request(
+            session, args.address, args.data_path, args.secret_path, args.output_path
+        )
 
 if __name__ == '__main__':
+    basicLoggingConfig(level=LOGGING_INFO)
     run(main())
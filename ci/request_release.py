@@ -0,0 +1,32 @@
+"""
+Release request utility to be integrated in CI:
+requests the mailing and the print version at once.
+"""
+
+from asyncio import run, gather
+from logging import basicConfig as basicLoggingConfig, INFO as LOGGING_INFO
+from common_req import perform_mail_request, save_print_request, get_arguments, \
+                       create_session, get_mail_fields, get_mail_route, get_print_route
+
+async def main():
+    """
+    Load arguments, perform both requests concurrently over a shared session.
+    """
+
+    args = get_arguments('release')
+    async with create_session(args.timeout) as session:
+        await gather(
+            perform_mail_request(
+                session, get_mail_route(args.address), args.data_path, args.secret_path,
+                fields=get_mail_fields(args),
+                wait=args.wait
+            ),
+            save_print_request(
+                session, get_print_route(args.address), args.data_path, args.secret_path,
+                args.output_path
+            )
+        )
+
+if __name__ == '__main__':
+    basicLoggingConfig(level=LOGGING_INFO)
+    run(main())
@@ -14,6 +14,9 @@ from time import gmtime
 from calendar import timegm
 from random import randint
 
+# TOTP time step in seconds
+TIME_STEP = 30
+
 def get_hotp_token(secret, intervals_no):
     """
     HMAC-based One-Time Password generator, which is changed with each call,
@@ -39,7 +42,7 @@ def get_totp_token(secret: str):
         token = get_totp_token(secret)
     """
     # Ensuring to give the same otp for 30 seconds
-    x = str(get_hotp_token(secret, intervals_no=int(timegm(gmtime()))//30))
+    x = str(get_hotp_token(secret, intervals_no=int(timegm(gmtime()))//TIME_STEP))
     # Adding 0 in the beginning until OTP has 6 digits
     while len(x) != 6:
         x += '0'
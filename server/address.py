@@ -2,20 +2,29 @@
 Address book utilities.
 """
 
-from os import urandom
+from os import urandom, access, R_OK, W_OK
 from hashlib import sha1
 from logging import info, error
-from yaml import safe_dump, safe_load
 
 class AddressBook:
     """
     Address book manipulation class.
     The address book is a list of emails and their hashes.
+
+    PyYAML is imported by the methods themselves,
+    as the address book is not needed to start the server.
     """
 
     def __init__(self, addr_file_path):
         self.addr_file_path = addr_file_path
 
+    def is_available(self):
+        """
+        Returns:
+            (Boolean) True if the address book file can be read and updated
+        """
+        return access(self.addr_file_path, R_OK | W_OK)
+
     def init_emails(self):
         """
         Create an address book file.
@@ -31,6 +40,8 @@ class AddressBook:
         Returns:
             (dict) hashes as keys, emails as values
         """
+        # pylint: disable=C0415
+        from yaml import safe_load
         emails = []
         try:
             with open(self.addr_file_path, 'r', encoding='utf-8') as addr_file:
@@ -45,6 +56,8 @@ class AddressBook:
         Adds an email.
         Returns True if it isn't present in the file.
         """
+        # pylint: disable=C0415
+        from yaml import safe_dump
         unique = True
         email = email.strip().lower()
         mail_hash = sha1(email.encode('ascii') + urandom(8)).hexdigest()
@@ -66,6 +79,8 @@ class AddressBook:
         Returns:
             the unsubscribed user's email
         """
+        # pylint: disable=C0415
+        from yaml import safe_dump
         emails = await self.read_emails()
         result = emails.pop(mail_hash, None)
         with open(self.addr_file_path, 'w', encoding='utf-8') as addr_file:
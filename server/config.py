@@ -4,32 +4,56 @@ the configuration validation and getters.
 """
 
 import sys
-from tomllib import load as toml_load
+from tomllib import load as toml_load, TOMLDecodeError
 from json import load as json_load
 from logging import error, exception
-from jsonschema import validate, Draft202012Validator
-from jsonschema.exceptions import SchemaError
+from functools import lru_cache
+from pathlib import Path
+from tempfile import gettempdir
+from jsonschema import Draft202012Validator
+from jsonschema.exceptions import SchemaError, ValidationError
 from filesystem import get_code_dir
 
+@lru_cache(maxsize=None)
+def get_validator():
+    """
+    Load the JSON schema and compile a validator for it once.
+
+    Returns:
+        (Draft202012Validator): a validator for the TOML config
+    """
+    schema_path = get_code_dir() / 'config_schema.json'
+    with open(schema_path, encoding='utf-8') as schema_file:
+        schema = json_load(schema_file)
+    Draft202012Validator.check_schema(schema)
+    return Draft202012Validator(
+        schema,
+        format_checker=Draft202012Validator.FORMAT_CHECKER
+    )
+
 class Config:
     """
     Configuration retrieval class.
     """
 
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, exit_on_error: bool = True):
         """
         Load the configuration, exit if it has issues.
 
         Args:
             config_path (str): a path to the current TOML config
+            exit_on_error (bool): exit on an improper configuration;
+                                  otherwise, the error is kept in the "error" attribute,
+                                  which is used when the configuration is reloaded
         """
         self.load_schema()
         self.config = self.load_config(config_path)
-        validation_error = self.validate_config(self.config)
-        if validation_error:
+        self.error = self.validate_config(self.config)
+        if self.error:
             error("Improper configuration")
-            exception(validation_error)
-            sys.exit(1)
+            exception(self.error)
+            if exit_on_error:
+                sys.exit(1)
 
     def load_config(self, config_path: str):
         """
@@ -44,31 +68,27 @@ class Config:
                 config = toml_load(config_file)
         except FileNotFoundError:
             error(f"Configuration file not found: {config_path}")
+        except TOMLDecodeError as err:
+            error(f"Unable to parse the configuration file {config_path}: {err}")
         return config
 
     def load_schema(self):
         """
         Load a JSON schema for validating the TOML config
         """
-        schema_path = get_code_dir() / 'config_schema.json'
-        with open(schema_path, encoding='utf-8') as schema_file:
-            self.schema = json_load(schema_file)
+        self.schema = get_validator().schema
 
     def validate_config(self, config):
         """
         An internal function to validate the JSON config.
 
         Returns:
-            None on success, SchemaError instance on validation failure.
+            None on success, SchemaError or ValidationError instance on failure.
         """
         output_error = None
         try:
-            validate(
-                instance=config,
-                schema=self.schema,
-                format_checker=Draft202012Validator.FORMAT_CHECKER
-            )
-        except SchemaError as err:
+            get_validator().validate(config)
+        except (SchemaError, ValidationError) as err:
             output_error = err
         return output_error
 
@@ -84,6 +104,72 @@ class Config:
             'port': self.config['http']['port']
         }
 
+    def check_warmup_mode(self):
+        """
+        Returns:
+            (Boolean) returns True if the templates are precompiled on startup
+        """
+        return self.config['http'].get('warmup_templates', False)
+
+    def get_monitor_options(self):
+        """
+        Returns:
+            (dict): event loop monitor options, in seconds:
+            the lag sampling interval and the threshold
+            after which the blocking code is logged.
+        """
+        monitor = self.config.get('monitor', {})
+        return {
+            'interval': monitor.get('lag_interval_ms', 500) / 1000,
+            'slow_callback': monitor.get('slow_callback_ms', 100) / 1000
+        }
+
+    def get_dispatch_options(self):
+        """
+        Returns:
+            (dict): mail dispatcher options, the intervals in seconds:
+            the total and per-domain concurrency, the per-domain send interval,
+            the attempts and the delay for the throttled mails,
+            and the overrides for specific domains.
+        """
+        dispatch = self.config.get('dispatch', {})
+        domain_concurrency = dispatch.get('domain_concurrency', 1)
+        domain_interval_ms = dispatch.get('domain_interval_ms', 1000)
+        return {
+            'concurrency': dispatch.get('concurrency', 4),
+            'domain_concurrency': domain_concurrency,
+            'domain_interval': domain_interval_ms / 1000,
+            'max_attempts': dispatch.get('max_attempts', 3),
+            'retry_delay': dispatch.get('retry_delay_ms', 30000) / 1000,
+            'domains': {
+                domain.lower(): {
+                    'concurrency': options.get('concurrency', domain_concurrency),
+                    'interval': options.get('interval_ms', domain_interval_ms) / 1000
+                }
+                for domain, options in dispatch.get('domains', {}).items()
+            }
+        }
+
+    def get_dry_run_path(self):
+        """
+        Returns:
+            (str): a directory for the dry-run campaign mailboxes
+        """
+        default_path = str(Path(gettempdir()) / 'iroha_mailer_dry_run')
+        return self.config.get('dry_run', {}).get('path', default_path)
+
+    def get_totp_options(self):
+        """
+        Returns:
+            (dict): TOTP verifier options: the amount of the time steps
+            accepted around the current one and the size of the used keys cache.
+        """
+        totp = self.config.get('totp', {})
+        return {
+            'window': totp.get('window', 1),
+            'replay_cache_size': totp.get('replay_cache_size', 64)
+        }
+
     def get_email_from(self):
         """
         Returns:
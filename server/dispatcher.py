@@ -0,0 +1,204 @@
+"""
+Recipient-domain-aware mail dispatching.
+
+The recipients are grouped by their domain, and each domain gets
+its own workers, limited by the per-domain concurrency and send interval.
+All the domains share the global concurrency limit. Its waiters are served
+in FIFO order, so the domains which are ready to send take turns,
+and a large provider can't take over the whole campaign.
+"""
+
+from asyncio import Semaphore, TaskGroup, sleep, get_running_loop
+from collections import deque
+from logging import warning, exception, error
+
+def get_domain(email: str):
+    """
+    Returns:
+        (str): the domain part of an email address
+    """
+    return email.rpartition('@')[2].lower()
+
+def group_by_domain(emails: dict):
+    """
+    Returns:
+        (dict): domains as keys, deques of (hash, email, attempt) tuples as values;
+                the address book order is kept within a domain
+    """
+    domains = {}
+    for mail_hash, email in emails.items():
+        domains.setdefault(get_domain(email), deque()).append((mail_hash, email, 0))
+    return domains
+
+def is_throttled(err: Exception):
+    """
+    Returns:
+        (Boolean) True for the temporary SMTP failures (4xx),
+        like "421 Too many connections", which are worth a retry
+    """
+    # pylint: disable=C0415
+    from aiosmtplib.errors import SMTPResponseException, SMTPRecipientsRefused
+    if isinstance(err, SMTPRecipientsRefused):
+        return any(400 <= refused.code < 500 for refused in err.recipients)
+    return isinstance(err, SMTPResponseException) and 400 <= err.code < 500
+
+class DomainLane:
+    """
+    The recipients of a single domain and their send pacing.
+    """
+
+    def __init__(self, domain: str, recipients: deque, concurrency: int, interval: float):
+        """
+        Args:
+            domain (str): the recipient domain
+            recipients (deque): (hash, email, attempt) tuples to send to
+            concurrency (int): parallel sends to the domain
+            interval (float): seconds between the sends to the domain
+        """
+        self.domain = domain
+        self.recipients = recipients
+        self.concurrency = concurrency
+        self.interval = interval
+        self.next_send = 0.0
+
+    async def wait_turn(self):
+        """
+        Wait until the domain can be sent to again.
+        """
+        delay = self.next_send - get_running_loop().time()
+        if delay > 0:
+            await sleep(delay)
+
+    def reserve(self):
+        """
+        Take the send slot of the domain for a send starting now.
+        The interval is counted from the actual send, so a worker
+        which waited for the global slots doesn't send too early.
+
+        Returns:
+            (Boolean) True if the interval has passed since the previous send
+        """
+        now = get_running_loop().time()
+        if now < self.next_send:
+            return False
+        self.next_send = now + self.interval
+        return True
+
+    def hold(self, delay: float):
+        """
+        Hold the domain back after it throttled the campaign.
+
+        Args:
+            delay (float): seconds to wait before the next send to the domain
+        """
+        self.next_send = max(self.next_send, get_running_loop().time() + delay)
+
+# The limits are kept as attributes to be read by the workers
+# pylint: disable=R0902
+class Dispatcher:
+    """
+    Sends a campaign, interleaving the recipient domains.
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, send, *, concurrency: int = 4, domain_concurrency: int = 1,
+                 domain_interval: float = 1.0, max_attempts: int = 3,
+                 retry_delay: float = 30.0, domains: dict = None, pace: float = 0.0):
+        """
+        Args:
+            send (coroutine function): sends a mail, accepting a hash and an email
+            concurrency (int): parallel sends in total
+            domain_concurrency (int): parallel sends to a single domain
+            domain_interval (float): seconds between the sends to a single domain
+            max_attempts (int): attempts per recipient when the domain throttles
+            retry_delay (float): seconds to hold a throttling domain back,
+                                 doubled with each attempt
+            domains (dict): per-domain "concurrency" and "interval" overrides
+            pace (float): seconds between the sends in total,
+                          used to spread a campaign over its delivery window
+        """
+        self.send = send
+        self.slots = Semaphore(concurrency)
+        self.domain_concurrency = domain_concurrency
+        self.domain_interval = domain_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.domains = domains or {}
+        self.pace = pace
+        self.next_send = 0.0
+        self.remaining = 0
+
+    def get_lane(self, domain: str, recipients: deque):
+        """
+        Returns:
+            (DomainLane): a lane with the domain-specific limits
+        """
+        options = self.domains.get(domain, {})
+        return DomainLane(
+            domain, recipients,
+            concurrency=options.get('concurrency', self.domain_concurrency),
+            interval=options.get('interval', self.domain_interval)
+        )
+
+    async def wait_pace(self):
+        """
+        Reserve the next send slot of the campaign and wait for it.
+        """
+        if not self.pace:
+            return
+        now = get_running_loop().time()
+        send_at = max(self.next_send, now)
+        self.next_send = send_at + self.pace
+        if send_at > now:
+            await sleep(send_at - now)
+
+    async def work(self, lane: DomainLane, progress):
+        """
+        Send the mails of a domain until its queue is empty.
+        """
+        # pylint: disable=C0415
+        from aiosmtplib.errors import SMTPException
+        while lane.recipients:
+            mail_hash, email, attempt = lane.recipients.popleft()
+            await lane.wait_turn()
+            async with self.slots:
+                await self.wait_pace()
+                if not lane.reserve():
+                    # Another worker of the domain has sent meanwhile
+                    lane.recipients.appendleft((mail_hash, email, attempt))
+                    continue
+                try:
+                    await self.send(mail_hash, email)
+                    progress.record_sent()
+                    self.remaining -= 1
+                except SMTPException as smtp_exc:
+                    if is_throttled(smtp_exc) and attempt + 1 < self.max_attempts:
+                        delay = self.retry_delay * 2 ** attempt
+                        warning(f'{lane.domain} throttles the mails: {smtp_exc}, '
+                                f'retrying {email} in {delay:.1f} s')
+                        lane.hold(delay)
+                        lane.recipients.append((mail_hash, email, attempt + 1))
+                        continue
+                    progress.record_error(smtp_exc)
+                    self.remaining -= 1
+                    exception(smtp_exc)
+                    error(f'Unable to send mail to {email}')
+
+    async def run(self, emails: dict, progress):
+        """
+        Send the mails to every address.
+
+        Args:
+            emails (dict): hashes as keys, emails as values
+            progress (CampaignProgress): the progress to update
+        """
+        self.remaining = len(emails)
+        lanes = [
+            self.get_lane(domain, recipients)
+            for domain, recipients in group_by_domain(emails).items()
+        ]
+        # The task group stops every worker if one of them fails
+        async with TaskGroup() as workers:
+            for lane in lanes:
+                for _ in range(min(lane.concurrency, len(lane.recipients))):
+                    workers.create_task(self.work(lane, progress))
@@ -0,0 +1,132 @@
+"""
+Dry-run campaign utilities: local mailbox sinks and stage timings.
+
+A dry run goes through the whole mailing pipeline, but the messages
+are written to a local mbox file or a Maildir instead of the SMTP server.
+"""
+
+from io import BytesIO
+from pathlib import Path
+from uuid import uuid4
+from time import time, perf_counter, asctime, gmtime
+from contextlib import contextmanager
+from email.generator import BytesGenerator
+from mailbox import Maildir
+
+# Write buffer size for the mbox sink, in bytes
+MBOX_BUFFER_SIZE = 1024 * 1024
+
+class StageTimer:
+    """
+    Accumulates the time spent in the named pipeline stages.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measure a stage, adding its time to the previous runs.
+        """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + perf_counter() - started
+
+    def get_report(self):
+        """
+        Returns:
+            (dict): stage names as keys, milliseconds as values
+        """
+        return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+
+class MboxSink:
+    """
+    Writes the messages to a new mbox file through a large write buffer.
+    """
+
+    extension = '.mbox'
+
+    def __init__(self, path: str):
+        self.path = path
+        # pylint: disable=R1732
+        # The file is created exclusively, so a dry run never writes into another one
+        self.file = open(path, 'xb', buffering=MBOX_BUFFER_SIZE)
+
+    def encode(self, msg):
+        """
+        Returns:
+            (bytes): an mbox entry, with the "From " lines of the body escaped
+        """
+        msg.set_unixfrom(f'From MAILER-DAEMON {asctime(gmtime())}')
+        output = BytesIO()
+        BytesGenerator(output, mangle_from_=True).flatten(msg, unixfrom=True)
+        output.write(b'\n')
+        return output.getvalue()
+
+    def write(self, data: bytes):
+        """
+        Add an encoded message.
+        """
+        self.file.write(data)
+
+    def close(self):
+        """
+        Flush the buffer and close the file.
+        """
+        self.file.close()
+
+class MaildirSink:
+    """
+    Adds the messages to a new Maildir, a file per message.
+    """
+
+    extension = ''
+
+    def __init__(self, path: str):
+        self.path = path
+        # The directory is created exclusively, so a dry run never writes into another one
+        Path(path).mkdir(mode=0o700)
+        for subdirectory in ('tmp', 'new', 'cur'):
+            (Path(path) / subdirectory).mkdir(mode=0o700)
+        self.mailbox = Maildir(path, create=False)
+
+    def encode(self, msg):
+        """
+        Returns:
+            (bytes): the message
+        """
+        return msg.as_bytes()
+
+    def write(self, data: bytes):
+        """
+        Add an encoded message.
+        """
+        self.mailbox.add(data)
+
+    def close(self):
+        """
+        Close the mailbox.
+        """
+        self.mailbox.close()
+
+# Dry-run output formats
+SINKS = {
+    'mbox': MboxSink,
+    'maildir': MaildirSink
+}
+
+def open_sink(directory: str, sink_format: str):
+    """
+    Create a new mailbox for a dry run in the given directory.
+    The name is unique, so the concurrent dry runs get separate mailboxes.
+
+    Returns:
+        (MboxSink / MaildirSink): the sink
+    """
+    sink_class = SINKS[sink_format]
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    name = f'dry_run_{int(time())}_{uuid4().hex}{sink_class.extension}'
+    return sink_class(Path(directory) / name)
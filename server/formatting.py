@@ -2,14 +2,15 @@
 Internal utilities, not fitting in other packages.
 """
 
-from markdown import markdown
-
 def reformat_input_data(data):
     """
     Returns:
         (dict): a dictionary with 'delivered', 'current_work', 'planned'
                 string lists, reformatted from Markdown to HTML.
     """
+    # Markdown is only needed for the API calls, not the site pages
+    # pylint: disable=C0415
+    from markdown import markdown
 
     if 'delivered' in data:
         data['delivered'] = [markdown(item) for item in data['delivered']]
@@ -2,18 +2,43 @@
 
 """
 This file contains a healthcheck script for the mailer.
+
+It only uses the standard library, as the healthcheck
+runs often and shouldn't pay for importing AioHTTP.
 """
 
 import sys
-from asyncio import run
-from aiohttp import ClientSession
+from argparse import ArgumentParser
+from urllib.request import urlopen
+from urllib.error import URLError
+
+# The server address
+ADDRESS = 'http://127.0.0.1:8080'
+# Seconds to wait for the answer
+TIMEOUT = 2
+
+def get_arguments():
+    """
+    Returns:
+        (argparse.Namespace): a namespace with the probe selection
+    """
+    parser = ArgumentParser(description="Iroha mailer healthcheck")
+    parser.add_argument(
+        '-r', '--ready',
+        help="Check the readiness instead of the liveness",
+        action='store_true'
+    )
+    return parser.parse_args()
 
-async def main():
+def main():
     # pylint: disable=C0116
-    async with ClientSession() as session:
-        req = await session.get('http://127.0.0.1:8080')
-        if req.status != 200:
-            sys.exit(1)
+    route = '/readyz' if get_arguments().ready else '/healthz'
+    try:
+        with urlopen(ADDRESS + route, timeout=TIMEOUT) as req:
+            if req.status != 200:
+                sys.exit(1)
+    except (URLError, TimeoutError):
+        sys.exit(1)
 
 if __name__ == '__main__':
-    run(main())
+    main()
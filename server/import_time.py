@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Import time benchmark for the server modules.
+
+Runs each module import in a fresh interpreter with "-X importtime"
+and reports the cumulative time, so that a heavy import
+sneaking into the startup path becomes visible.
+"""
+
+import sys
+from argparse import ArgumentParser
+from subprocess import run
+from filesystem import get_code_dir
+
+# The modules loaded by the short-lived and the long-running entry points
+MODULES = ['healthcheck', 'server']
+
+def measure_import(module: str):
+    """
+    Returns:
+        (tuple): the cumulative import time of the module in microseconds
+                 and a dict with its direct imports as keys
+                 and their cumulative import times as values
+    """
+    result = run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=get_code_dir(), capture_output=True, text=True, check=True
+    )
+    # The nested imports are reported before the module importing them,
+    # so the direct imports are collected until their parent shows up
+    direct_imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            direct_imports[name.strip()] = int(cumulative)
+        elif depth == 0:
+            # The interpreter startup modules are reported at the top level too
+            if name.strip() == module:
+                return int(cumulative), direct_imports
+            direct_imports = {}
+    return 0, {}
+
+def measure_best(module: str, runs: int):
+    """
+    Returns:
+        (tuple): the measure_import result of the fastest run
+    """
+    return min((measure_import(module) for _ in range(runs)), key=lambda result: result[0])
+
+def get_arguments():
+    """
+    Returns:
+        (argparse.Namespace): benchmark options
+    """
+    parser = ArgumentParser(description="Server import time benchmark")
+    parser.add_argument(
+        'modules', nargs='*', default=MODULES,
+        help="Entry points to measure, all of them by default"
+    )
+    parser.add_argument(
+        '-n', '--top', type=int, default=10,
+        help="Amount of the slowest top-level imports to show"
+    )
+    parser.add_argument(
+        '-r', '--runs', type=int, default=3,
+        help="Amount of runs per entry point, the fastest one is reported"
+    )
+    parser.add_argument(
+        '-m', '--max_ms', type=float, default=None,
+        help="Fail if any entry point takes longer to import, in milliseconds"
+    )
+    return parser.parse_args()
+
+def main():
+    """
+    Measure the entry points, print the slowest imports,
+    exit with an error if the limit is exceeded.
+    """
+    args = get_arguments()
+    failed = False
+    for module in args.modules:
+        total, direct_imports = measure_best(module, args.runs)
+        total_ms = total / 1000
+        print(f'{module}: {total_ms:.1f} ms')
+        # Direct imports only, nested ones are included in their parents
+        slowest = sorted(direct_imports.items(), key=lambda item: -item[1])
+        for name, value in slowest[:args.top]:
+            print(f'    {name}: {value / 1000:.1f} ms')
+        if args.max_ms is not None and total_ms > args.max_ms:
+            failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Runtime monitoring utilities for the server health reports.
+"""
+
+import sys
+from collections import OrderedDict
+from time import time, monotonic
+from threading import Thread, Event, get_ident
+from traceback import format_stack
+from logging import info, warning
+from asyncio import sleep, get_running_loop, CancelledError
+
+# The sampler and the watchdog share their state through the attributes
+# pylint: disable=R0902
+class LoopLagMonitor:
+    """
+    Event loop lag sampler.
+
+    Sleeps for a fixed interval in a background task and measures
+    how late the loop wakes it up. A large lag means some callback
+    blocks the loop.
+
+    A watchdog thread checks the sampler while the loop is blocked
+    and logs the stack of the blocking code, once per stall.
+    """
+
+    def __init__(self, interval: float = 0.5, slow_callback: float = 0.1):
+        """
+        Args:
+            interval (float): seconds between the samples
+            slow_callback (float): seconds of blocking after which
+                                   the blocking code is logged
+        """
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.task = None
+        # The moment the sampler is expected to wake up
+        self.deadline = monotonic()
+        self.reported_deadline = None
+        self.loop_thread_id = None
+        self.watchdog = None
+        self.stopped = Event()
+
+    async def sample(self):
+        """
+        Measure the loop lag until cancelled.
+        """
+        try:
+            while True:
+                self.deadline = monotonic() + self.interval
+                await sleep(self.interval)
+                self.lag = max(monotonic() - self.deadline, 0.0)
+                self.max_lag = max(self.max_lag, self.lag)
+                if self.lag > self.slow_callback:
+                    warning(f'Event loop was blocked for {self.lag * 1000:.1f} ms')
+        except CancelledError:
+            pass
+
+    def watch(self):
+        """
+        Watchdog thread body: log the loop thread stack
+        when the sampler is late for more than the threshold.
+        """
+        while not self.stopped.wait(self.slow_callback / 2):
+            deadline = self.deadline
+            late = monotonic() - deadline
+            if late <= self.slow_callback or deadline == self.reported_deadline:
+                continue
+            self.reported_deadline = deadline
+            # pylint: disable=W0212
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                warning(
+                    f'Event loop blocked for over {late * 1000:.1f} ms in:\n' +
+                    ''.join(format_stack(frame))
+                )
+
+    def start(self):
+        """
+        Start sampling in the running loop.
+        """
+        self.loop_thread_id = get_ident()
+        self.task = get_running_loop().create_task(self.sample())
+        self.stopped.clear()
+        self.watchdog = Thread(target=self.watch, name='loop-watchdog', daemon=True)
+        self.watchdog.start()
+
+    async def stop(self):
+        """
+        Stop sampling and wait for the task to finish.
+        """
+        self.stopped.set()
+        if self.watchdog:
+            self.watchdog.join()
+            self.watchdog = None
+        if self.task:
+            self.task.cancel()
+            await self.task
+            self.task = None
+
+    def get_state(self):
+        """
+        Returns:
+            (dict): the last and the maximum lag in milliseconds
+        """
+        return {
+            'lag_ms': round(self.lag * 1000, 3),
+            'max_lag_ms': round(self.max_lag * 1000, 3)
+        }
+
+# The amount of the finished campaigns to keep the progress of
+CAMPAIGN_HISTORY = 100
+
+class CampaignProgress:
+    """
+    The progress of a single campaign.
+    The results are also counted in the shared mailing state.
+    """
+
+    def __init__(self, mailing, total: int):
+        """
+        Args:
+            mailing (MailingState): the shared mailing state
+            total (int): the amount of recipients
+        """
+        self.mailing = mailing
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.state = 'sending'
+
+    def record_sent(self):
+        """
+        Register a successfully sent email.
+        """
+        self.sent += 1
+        self.mailing.record_sent()
+
+    def record_error(self, err: Exception):
+        """
+        Register a failed email.
+        """
+        self.failed += 1
+        self.mailing.record_error(err)
+
+    def get_state(self):
+        """
+        Returns:
+            (dict): the campaign state and its counters
+        """
+        return {
+            'state': self.state,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed
+        }
+
+class MailingState:
+    """
+    Mailing progress and SMTP relay state, shared by the campaigns.
+
+    There is no persistent SMTP connection, so the relay state
+    is the outcome of the latest send attempt.
+    """
+
+    def __init__(self):
+        self.campaigns = 0
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_success = None
+        self.last_error = None
+        self.progress = OrderedDict()
+
+    def start_campaign(self, campaign_id: str, size: int):
+        """
+        Register a campaign with the given amount of recipients.
+
+        Returns:
+            (CampaignProgress): the campaign progress to update
+        """
+        self.campaigns += 1
+        self.queued += size
+        self.progress[campaign_id] = CampaignProgress(self, size)
+        return self.progress[campaign_id]
+
+    def finish_campaign(self, campaign_id: str, remaining: int = 0, failed: bool = False):
+        """
+        Unregister a campaign, dropping its unsent recipients from the queue.
+        """
+        self.campaigns -= 1
+        self.queued -= remaining
+        progress = self.progress[campaign_id]
+        progress.state = 'failed' if failed else 'done'
+        # The counters are only logged, the status route reports the state alone
+        info(f'Campaign {campaign_id} {progress.state}: {progress.get_state()}')
+        # Forget the oldest finished campaigns
+        finished = [
+            key for key, progress in self.progress.items()
+            if progress.state != 'sending'
+        ]
+        for key in finished[:-CAMPAIGN_HISTORY]:
+            del self.progress[key]
+
+    def record_sent(self):
+        """
+        Register a successfully sent email.
+        """
+        self.queued -= 1
+        self.sent += 1
+        self.last_success = time()
+
+    def record_error(self, err: Exception):
+        """
+        Register a failed email.
+        """
+        self.queued -= 1
+        self.failed += 1
+        self.last_error = {'time': time(), 'error': repr(err)}
+
+    def get_state(self):
+        """
+        Returns:
+            (dict): the queue and SMTP state
+        """
+        return {
+            'campaigns': self.campaigns,
+            'queue_depth': self.queued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'smtp_last_success': self.last_success,
+            'smtp_last_error': self.last_error
+        }
@@ -0,0 +1,103 @@
+"""
+On-demand CPU profiling of the running server.
+
+Two output formats are supported:
+
+* "pstats": a cProfile dump, readable with the "pstats" module or snakeviz
+* "collapsed": sampled stacks of the event loop thread in the collapsed format,
+  readable with flamegraph.pl, speedscope or inferno
+"""
+
+import sys
+from asyncio import sleep
+from collections import Counter
+from cProfile import Profile
+from marshal import dumps
+from threading import Thread, Event, get_ident
+
+# Supported profile formats
+PROFILE_FORMATS = ('pstats', 'collapsed')
+
+class StackSampler:
+    """
+    Samples the stack of a single thread from a helper thread.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        """
+        Args:
+            thread_id (int): the thread to sample
+            interval (float): seconds between the samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = Event()
+        self.thread = None
+
+    def sample(self):
+        """
+        Sampler thread body: count the stacks until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            # pylint: disable=W0212
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        """
+        Start sampling.
+        """
+        self.thread = Thread(target=self.sample, name='stack-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the thread to finish.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+    def dumps(self):
+        """
+        Returns:
+            (bytes): the samples in the collapsed stack format
+        """
+        lines = [f'{stack} {count}' for stack, count in self.stacks.items()]
+        return '\n'.join(lines).encode('utf-8') + b'\n'
+
+async def capture_profile(seconds: float, profile_format: str):
+    """
+    Profile the event loop thread for a given time.
+    Has to be awaited in the event loop thread.
+
+    Args:
+        seconds (float): profiling duration
+        profile_format (str): "pstats" or "collapsed"
+
+    Returns:
+        (bytes): profile file contents
+    """
+    if profile_format == 'pstats':
+        profiler = Profile()
+        profiler.enable()
+        try:
+            await sleep(seconds)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        # The same layout as pstats.Stats.dump_stats uses
+        return dumps(profiler.stats)
+    sampler = StackSampler(get_ident())
+    sampler.start()
+    try:
+        await sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler.dumps()
@@ -3,7 +3,18 @@ Internal template code with the async support.
 """
 
 from tomllib import loads
-from jinja2 import FileSystemLoader, Environment
+from pathlib import Path
+
+# The current environment of each template directory, replaced on reload.
+# The campaigns keep the environment they started with.
+ENVIRONMENTS = {}
+# File modification times of the template directories in use,
+# compared on reload to find the changed directories
+TEMPLATE_MTIMES = {}
+# Rendered pages which don't depend on the template data
+PAGE_CACHE = {}
+# The minimal size of a streamed template chunk, in characters
+STREAM_CHUNK_SIZE = 16 * 1024
 
 def decode_template_data(serialized: str):
     """
@@ -12,16 +23,71 @@ def decode_template_data(serialized: str):
     data = loads(serialized)
     return data
 
-# There's no reason to show a PyLint warning as
-# I know I want to refactor it.
-# pylint: disable=R0903
+def get_template_mtimes(template_path: str):
+    """
+    Returns:
+        (dict): template file paths as keys, modification times as values
+    """
+    return {
+        str(file_path): file_path.stat().st_mtime_ns
+        for file_path in Path(template_path).rglob('*')
+        if file_path.is_file()
+    }
+
+def get_environment(template_path: str):
+    """
+    Returns:
+        (jinja2.Environment): the current environment of a template directory.
+        Jinja keeps the compiled templates in the environment cache,
+        so each template is compiled once per directory.
+        The files aren't checked on each render, use invalidate_templates
+        to pick up the changes.
+    """
+    if template_path not in ENVIRONMENTS:
+        # Jinja is imported on the first render to keep the cold start short
+        # pylint: disable=C0415
+        from jinja2 import FileSystemLoader, Environment
+        TEMPLATE_MTIMES[template_path] = get_template_mtimes(template_path)
+        template_loader = FileSystemLoader(searchpath=str(template_path))
+        # The cache is unbounded, so that an environment never
+        # recompiles an evicted template from the changed files
+        ENVIRONMENTS[template_path] = Environment(
+            loader=template_loader, enable_async=True, auto_reload=False, cache_size=-1
+        )
+    return ENVIRONMENTS[template_path]
+
+def invalidate_templates(template_path: str):
+    """
+    Replace the environment and drop the rendered pages of a directory
+    if any of its files has changed. The templates include each other,
+    so the whole directory is invalidated. The previous environment
+    is left intact for the campaigns still rendering with it.
+
+    Returns:
+        (Boolean) True if the directory has changed
+    """
+    mtimes = get_template_mtimes(template_path)
+    if TEMPLATE_MTIMES.get(template_path, mtimes) == mtimes:
+        return False
+    TEMPLATE_MTIMES[template_path] = mtimes
+    ENVIRONMENTS.pop(template_path, None)
+    for key in [key for key in PAGE_CACHE if key[0] == template_path]:
+        del PAGE_CACHE[key]
+    return True
+
+def warmup(template_path: str, template_files: list):
+    """
+    Precompile the templates of a directory, so that the first
+    request doesn't pay for the compilation.
+    """
+    template_env = get_environment(template_path)
+    for template_file in template_files:
+        template_env.get_template(template_file)
+
 class Renderer:
     """
     A common rendering utility class.
     Used for both site and e-mail templates.
-
-    TODO:
-        introduce the template caching for the site templates
     """
 
     def __init__(self, template_path:str, template_file:str='index.html'):
@@ -31,12 +97,60 @@ class Renderer:
         self.template_path = template_path
         self.template_file = template_file
 
+    def get_template(self):
+        """
+        Returns:
+            (jinja2.Template): the compiled template.
+            The templates it extends, imports and includes are resolved
+            on render, use get_snapshot to render the same files for long.
+        """
+        return get_environment(self.template_path).get_template(self.template_file)
+
+    def get_snapshot(self):
+        """
+        Returns:
+            (jinja2.Template): the compiled template, with every template
+            of its directory compiled into the same environment.
+            A campaign keeps rendering the same files
+            even if the templates are reloaded meanwhile.
+        """
+        template_env = get_environment(self.template_path)
+        for template_file in template_env.list_templates():
+            template_env.get_template(template_file)
+        return template_env.get_template(self.template_file)
+
     async def render_template(self, template_data: dict):
         """
         Load and render a template using the provided data.
         """
-        template_loader = FileSystemLoader(searchpath=self.template_path)
-        template_env = Environment(loader=template_loader, enable_async=True)
-        page_template = template_env.get_template(self.template_file)
-        rendered_template = await page_template.render_async(template_data)
+        rendered_template = await self.get_template().render_async(template_data)
         return rendered_template
+
+    async def stream_template(self, template_data: dict, chunk_size: int = STREAM_CHUNK_SIZE):
+        """
+        Render a template part by part.
+        Jinja yields a lot of small strings, so they are joined into larger chunks.
+
+        Returns:
+            (async iterator): the rendered text chunks
+        """
+        buffer = []
+        buffer_size = 0
+        async for part in self.get_template().generate_async(template_data):
+            buffer.append(part)
+            buffer_size += len(part)
+            if buffer_size >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+                buffer_size = 0
+        if buffer:
+            yield ''.join(buffer)
+
+    async def render_page(self):
+        """
+        Render a template without any data, once until it's invalidated.
+        """
+        key = (self.template_path, self.template_file)
+        if key not in PAGE_CACHE:
+            PAGE_CACHE[key] = await self.render_template({})
+        return PAGE_CACHE[key]
@@ -0,0 +1,205 @@
+"""
+Delayed campaign delivery.
+
+The campaigns are kept in a timer heap, ordered by their start time,
+and saved to a JSON file, so that they survive a restart.
+A running campaign stays in the file with the hashes of the sent mails,
+and a restart resumes it with the remaining recipients.
+"""
+
+from os import replace
+from time import time
+from json import dump, load
+from heapq import heappush, heappop
+from datetime import datetime, timezone
+from logging import info, warning, error, exception
+from asyncio import Event, TimeoutError as AsyncTimeoutError, CancelledError, \
+    wait_for, gather, get_running_loop
+from uuid import uuid4
+
+# The sent mails are saved to the schedule file once per this amount of sends;
+# a restart repeats at most the unsaved ones
+SENT_SAVE_INTERVAL = 20
+
+def parse_time(value: str):
+    """
+    Parse an ISO 8601 date and time, UTC unless the offset is given.
+
+    Returns:
+        (float / None): a UNIX timestamp or None for an empty value
+
+    Raises:
+        ValueError: on an incorrect date
+    """
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+class CampaignScheduler:
+    """
+    Starts the campaigns at their scheduled time.
+    """
+
+    def __init__(self, start_campaign, state_path: str = None):
+        """
+        Args:
+            start_campaign (coroutine function): sends a campaign, accepting the template data,
+                the delivery window end, the campaign identifier and the keyword arguments
+                "sent" with the hashes to skip and "on_sent" called with each sent hash
+            state_path (str): a JSON file to keep the campaigns in;
+                without it, the campaigns are lost on restart
+        """
+        self.start_campaign = start_campaign
+        self.state_path = state_path
+        self.campaigns = {}
+        self.heap = []
+        self.wakeup = Event()
+        self.task = None
+        self.running = set()
+
+    def load(self):
+        """
+        Load the saved campaigns.
+        """
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as state_file:
+                self.campaigns = load(state_file)
+        except FileNotFoundError:
+            self.campaigns = {}
+        self.heap = []
+        for campaign_id, campaign in self.campaigns.items():
+            heappush(self.heap, (campaign['send_at'], campaign_id))
+        info(f'Loaded {len(self.campaigns)} scheduled campaigns')
+
+    def save(self):
+        """
+        Save the campaigns, replacing the file at once.
+        """
+        if not self.state_path:
+            return
+        temp_path = f'{self.state_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as state_file:
+            # TOML dates are saved as strings
+            dump(self.campaigns, state_file, default=str)
+        replace(temp_path, self.state_path)
+
+    def add(self, template_data: dict, send_at: float, window_end: float = None):
+        """
+        Schedule a campaign.
+
+        Args:
+            template_data (dict): the mail template data
+            send_at (float): a UNIX timestamp to start at
+            window_end (float / None): a UNIX timestamp to finish by
+
+        Returns:
+            (str): the campaign identifier
+        """
+        campaign_id = uuid4().hex
+        self.campaigns[campaign_id] = {
+            'send_at': send_at,
+            'window_end': window_end,
+            'template_data': template_data,
+            'started': False,
+            'sent': []
+        }
+        heappush(self.heap, (send_at, campaign_id))
+        self.save()
+        self.wakeup.set()
+        return campaign_id
+
+    def get_pending(self):
+        """
+        Returns:
+            (int): the amount of the campaigns which haven't started yet
+        """
+        return sum(not campaign.get('started') for campaign in self.campaigns.values())
+
+    def record_sent(self, campaign_id: str, mail_hash: str):
+        """
+        Register a sent mail of a running campaign,
+        saving the schedule once per SENT_SAVE_INTERVAL sends.
+        """
+        sent = self.campaigns[campaign_id]['sent']
+        sent.append(mail_hash)
+        if len(sent) % SENT_SAVE_INTERVAL == 0:
+            self.save()
+
+    async def run_campaign(self, campaign_id: str):
+        """
+        Send or resume a campaign, logging its failure.
+        The campaign is kept in the file until it's finished.
+        """
+        campaign = self.campaigns[campaign_id]
+        sent = campaign.setdefault('sent', [])
+        if campaign.get('started'):
+            info(f'Resuming the scheduled campaign {campaign_id}, {len(sent)} mails were sent')
+        else:
+            info(f'Starting the scheduled campaign {campaign_id}')
+            campaign['started'] = True
+            self.save()
+        # A failed campaign shouldn't stop the scheduler
+        # pylint: disable=W0718
+        try:
+            await self.start_campaign(
+                campaign['template_data'], campaign['window_end'], campaign_id,
+                sent=set(sent),
+                on_sent=lambda mail_hash: self.record_sent(campaign_id, mail_hash)
+            )
+        except CancelledError:
+            # Interrupted by a shutdown, the campaign is resumed on the next start
+            self.save()
+            raise
+        except Exception as err:
+            exception(err)
+            error(f'The scheduled campaign {campaign_id} has failed')
+        del self.campaigns[campaign_id]
+        self.save()
+
+    async def run(self):
+        """
+        Start the campaigns when their time comes.
+        """
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            send_at, campaign_id = self.heap[0]
+            delay = send_at - time()
+            if delay > 0:
+                # Wake up earlier if an earlier campaign is added
+                try:
+                    await wait_for(self.wakeup.wait(), delay)
+                except AsyncTimeoutError:
+                    pass
+                continue
+            heappop(self.heap)
+            task = get_running_loop().create_task(self.run_campaign(campaign_id))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    def start(self):
+        """
+        Load the saved campaigns and start waiting for them.
+        """
+        if not self.state_path:
+            warning('No schedule file set, the scheduled campaigns are lost on restart')
+        self.load()
+        self.task = get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the scheduler and the running campaigns,
+        saving the progress of the campaigns.
+        """
+        tasks = [task for task in [self.task, *self.running] if task]
+        for task in tasks:
+            task.cancel()
+        await gather(*tasks, return_exceptions=True)
+        self.task = None
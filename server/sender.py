@@ -5,11 +5,10 @@ through an SMTP server using aiosmtplib.
 
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from aiosmtplib import SMTP
 
-async def send_mail_async(sender, to, subject, text, **params):
+def build_message(sender, to, subject, text, **params):
     """
-    Send an outgoing email with the given parameters.
+    Build an outgoing email with the given parameters.
 
     Arguments:
 
@@ -25,17 +24,16 @@ async def send_mail_async(sender, to, subject, text, **params):
     text:
         (str) The text of the email.
 
-    text:
-        (str) str
-
     params:
-        (dict) An optional set of parameters. (See below)
+        (dict) An optional set of parameters: "cc", "bcc" and "list_unsubscribe".
+
+    Returns:
+        (MIMEMultipart): the message
     """
 
     # Default Parameters
     cc = params.get("cc", [])
     bcc = params.get("bcc", [])
-    mail_params = params.get("mail_params")
     list_unsubscribe = params.get("list_unsubscribe", None)
 
     # Prepare Message
@@ -59,6 +57,22 @@ async def send_mail_async(sender, to, subject, text, **params):
     msg['Return-Receipt-To'] = f'"Iroha News" <{sender}>'
 
     msg.attach(MIMEText(text, 'html', 'utf-8'))
+    return msg
+
+async def send_message_async(msg, mail_params):
+    """
+    Send a prepared email through the SMTP server.
+
+    Arguments:
+
+    msg:
+        (MIMEMultipart) The message.
+
+    mail_params:
+        (dict) SMTP server configuration.
+    """
+    # pylint: disable=C0415
+    from aiosmtplib import SMTP
 
     # Contact SMTP server and send Message
     host = mail_params.get('host', 'localhost')
@@ -73,3 +87,28 @@ async def send_mail_async(sender, to, subject, text, **params):
         await smtp.login(mail_params['user'], mail_params['password'])
     await smtp.send_message(msg)
     await smtp.quit()
+
+async def send_mail_async(sender, to, subject, text, **params):
+    """
+    Send an outgoing email with the given parameters.
+
+    Arguments:
+
+    sender:
+        (str) Who sends the email
+
+    to:
+        (str) A recipient email addresses.
+
+    subject:
+        (str) The subject of the email.
+
+    text:
+        (str) The text of the email.
+
+    params:
+        (dict) An optional set of parameters: "mail_params" with the SMTP configuration,
+        and the build_message parameters.
+    """
+    msg = build_message(sender, to, subject, text, **params)
+    await send_message_async(msg, params.get("mail_params"))
@@ -9,19 +9,27 @@ sets up logging and OTP features.
 
 from logging import basicConfig as basicLoggingConfig, \
                     INFO as LOGGING_INFO, \
-                    warning, exception, error
-from asyncio import sleep
+                    info, warning, error
+from asyncio import sleep, get_running_loop
+from signal import SIGHUP
+from time import time, perf_counter
+from uuid import uuid4
 from aiohttp import web
-from aiosmtplib.errors import SMTPException
 
 from address import AddressBook
-from sender import send_mail_async
-from render import Renderer, decode_template_data
+from sender import send_mail_async, build_message
+from dispatcher import Dispatcher
+from scheduler import CampaignScheduler, parse_time
+from dryrun import StageTimer, SINKS, open_sink
+from streaming import send_stream
+from render import Renderer, decode_template_data, warmup, invalidate_templates
 from filesystem import get_code_dir
 from formatting import reformat_input_data
 from arguments import get_arguments
 from config import Config
-from totp import gen_otp_from_secret_file
+from totp import TOTPVerifier
+from monitor import LoopLagMonitor, MailingState
+from profiler import capture_profile, PROFILE_FORMATS
 
 # The location of a code
 CODE_DIR = get_code_dir()
@@ -29,6 +37,95 @@ CODE_DIR = get_code_dir()
 PRINT_TEMPLATE_PATH = CODE_DIR / 'templates/print'
 MAIL_TEMPLATE_PATH = CODE_DIR / 'templates/mail'
 SITE_TEMPLATE_PATH = CODE_DIR / 'templates/site'
+# The templates to precompile on startup when the warmup is enabled
+WARMUP_TEMPLATES = {
+    SITE_TEMPLATE_PATH: [
+        'index.html',
+        'subscription_successful.html',
+        'subscription_repeat.html',
+        'unsubscribed_successfully.html',
+        'unsubscribed_no_email.html'
+    ],
+    MAIL_TEMPLATE_PATH: ['index.html'],
+    PRINT_TEMPLATE_PATH: ['index.html']
+}
+# The template directories checked for changes on reload
+TEMPLATE_PATHS = [SITE_TEMPLATE_PATH, MAIL_TEMPLATE_PATH, PRINT_TEMPLATE_PATH]
+# The liveness response, served without any I/O
+HEALTHZ_BODY = b'ok'
+# The loop lag after which the server is reported as not ready
+READY_MAX_LAG_MS = 1000
+# The maximum amount of the address book passes for a dry run
+DRY_RUN_MAX_REPEAT = 1000
+# Profiling duration limits, in seconds
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 60
+
+def get_config(app):
+    """
+    Returns:
+        (Config): the current configuration, which may be replaced on reload
+    """
+    return app['live']['config']
+
+def reload_config(app):
+    """
+    Re-read the configuration and swap it if it's valid,
+    invalidate the changed template directories.
+
+    Returns:
+        (Boolean) True if the configuration was valid and has been applied
+    """
+    config = Config(app['config_path'], exit_on_error=False)
+    if config.error:
+        error('The configuration was not reloaded')
+        return False
+    if config.get_server_options() != get_config(app).get_server_options():
+        warning('HTTP server options are applied after a restart only')
+    app['live']['config'] = config
+    for template_path in TEMPLATE_PATHS:
+        if invalidate_templates(template_path):
+            info(f'Templates reloaded: {template_path}')
+    info('Configuration reloaded')
+    return True
+
+async def reload(request):
+    """
+    Reloads the configuration and the templates provided a proper TOTP key.
+    """
+    data = await request.post()
+    if not request.app['totp'].verify(data.get('password', ''), 'reload'):
+        warning(f'Incorrect key: {request.remote}')
+        return web.Response(text='Unable to reload', status=403)
+    if not reload_config(request.app):
+        return web.Response(text='Improper configuration', status=400)
+    return web.Response(text='Reloaded', status=200)
+
+async def healthz(_):
+    """
+    Liveness probe: answers as long as the event loop is running.
+    """
+    return web.Response(body=HEALTHZ_BODY, content_type='text/plain')
+
+async def readyz(request):
+    """
+    Readiness probe: reports the address book availability,
+    the mailing queue, SMTP relay state and the event loop lag.
+
+    Returns:
+
+        web.Response: a JSON report, status 200 if ready, 503 otherwise
+    """
+    book_available = request.app['book'].is_available()
+    loop_state = request.app['loop_monitor'].get_state()
+    ready = book_available and loop_state['lag_ms'] < READY_MAX_LAG_MS
+    return web.json_response({
+        'ready': ready,
+        'address_book': book_available,
+        'mailing': request.app['mailing'].get_state(),
+        'scheduled_campaigns': request.app['scheduler'].get_pending(),
+        'loop': loop_state
+    }, status=200 if ready else 503)
 
 async def index(_):
     """
@@ -38,7 +135,7 @@ async def index(_):
 
         web.Response: a response with the Index page content
     """
-    render_str = await Renderer(SITE_TEMPLATE_PATH).render_template({})
+    render_str = await Renderer(SITE_TEMPLATE_PATH).render_page()
     return web.Response(text=render_str, content_type='text/html')
 
 async def unsubscribe_by_hash(request):
@@ -58,7 +155,7 @@ async def unsubscribe_by_hash(request):
         text = await Renderer(
             SITE_TEMPLATE_PATH,
             template_file='unsubscribed_no_email.html'
-        ).render_template({})
+        ).render_page()
     return web.Response(text=text, content_type='text/html')
 
 async def subscribe(request):
@@ -73,58 +170,223 @@ async def subscribe(request):
         text = await Renderer(
             SITE_TEMPLATE_PATH,
             template_file='subscription_successful.html'
-        ).render_template({})
+        ).render_page()
     else:
         text = await Renderer(
             SITE_TEMPLATE_PATH,
             template_file='subscription_repeat.html'
-        ).render_template({})
+        ).render_page()
     return web.Response(text=text, content_type='text/html')
 
+async def render_mail(config, mail_template, template_data: dict, mail_hash: str):
+    """
+    Render a mail for a single subscriber.
+
+    Returns:
+        (tuple): the mail text and the unsubscription URL or None
+    """
+    unsubscribe_url = None
+    mail_data = template_data
+    if config.check_list_unsubscribe_mode():
+        unsubscribe_url = config.get_site_url() + \
+                          '/unsubscribe/hash/' + \
+                          mail_hash
+        # The mails are rendered concurrently, so the data is copied
+        mail_data = {**template_data, 'unsubscribe_url': unsubscribe_url}
+    mail_str = await mail_template.render_async(mail_data)
+    return mail_str, unsubscribe_url
+
+# The pipeline stages are kept inline to be timed separately
+# pylint: disable=R0914
+async def dry_run_campaign(app, template_data: dict, sink_format: str,
+                           timer: StageTimer, repeat: int = 1):
+    """
+    Go through the whole campaign pipeline at full speed,
+    writing the messages to a local mailbox instead of the SMTP server.
+
+    Args:
+        app (web.Application): the application
+        template_data (dict): the mail template data
+        sink_format (str): "mbox" or "maildir"
+        timer (StageTimer): the timer with the request stages measured
+        repeat (int): how many times to go through the address book
+
+    Returns:
+        (dict): the output path, per-stage timings and the throughput
+    """
+    config = get_config(app)
+    mail_template = Renderer(MAIL_TEMPLATE_PATH).get_snapshot()
+    emails = await app.get('book').read_emails()
+    subject = template_data['title'] + ': ' + template_data['date']
+    sink = open_sink(config.get_dry_run_path(), sink_format)
+    messages = 0
+    started = perf_counter()
+    try:
+        for _ in range(repeat):
+            for mail_hash, email in emails.items():
+                with timer.stage('render'):
+                    mail_str, unsubscribe_url = await render_mail(
+                        config, mail_template, template_data, mail_hash
+                    )
+                with timer.stage('build'):
+                    msg = build_message(
+                        config.get_email_from(), email, subject, mail_str,
+                        list_unsubscribe=unsubscribe_url
+                    )
+                with timer.stage('encode'):
+                    data = sink.encode(msg)
+                with timer.stage('write'):
+                    sink.write(data)
+                messages += 1
+                # Let the other requests through between the messages
+                await sleep(0)
+    finally:
+        with timer.stage('write'):
+            sink.close()
+    elapsed = perf_counter() - started
+    return {
+        'output': str(sink.path),
+        'messages': messages,
+        'stages_ms': timer.get_report(),
+        'total_s': round(elapsed, 3),
+        'messages_per_second': round(messages / elapsed, 1) if elapsed else None
+    }
+
+# pylint: disable=R0913
+async def send_campaign(app, template_data: dict, window_end: float = None,
+                        campaign_id: str = None, *, sent: set = None, on_sent=None):
+    """
+    Send the rendered emails to every subscriber.
+    The campaign keeps the configuration and the template it started with,
+    even if they are reloaded meanwhile.
+
+    Args:
+        app (web.Application): the application
+        template_data (dict): the mail template data
+        window_end (float / None): a UNIX timestamp to spread the mails until
+        campaign_id (str / None): the campaign identifier, used for the progress reports
+        sent (set / None): the hashes of the subscribers to skip,
+                           already sent to before a restart
+        on_sent (function / None): called with the hash of each sent mail
+    """
+    config = get_config(app)
+    mail_template = Renderer(MAIL_TEMPLATE_PATH).get_snapshot()
+
+    async def send(mail_hash: str, email: str):
+        mail_str, unsubscribe_url = await render_mail(
+            config, mail_template, template_data, mail_hash
+        )
+        await send_mail_async(
+            config.get_email_from(),
+            email,
+            template_data['title'] + ': ' + template_data['date'],
+            mail_str,
+            mail_params=config.get_smtp(),
+            list_unsubscribe=unsubscribe_url
+        )
+        if on_sent:
+            on_sent(mail_hash)
+
+    emails = await app.get('book').read_emails()
+    if sent:
+        emails = {
+            mail_hash: email for mail_hash, email in emails.items()
+            if mail_hash not in sent
+        }
+    # The pace of a resumed campaign is spread over the time left in the window
+    pace = 0.0
+    if window_end and emails:
+        pace = max(window_end - time(), 0.0) / len(emails)
+    dispatcher = Dispatcher(send, pace=pace, **config.get_dispatch_options())
+    mailing = app['mailing']
+    campaign_id = campaign_id or uuid4().hex
+    progress = mailing.start_campaign(campaign_id, len(emails))
+    failed = True
+    try:
+        await dispatcher.run(emails, progress)
+        failed = False
+    finally:
+        mailing.finish_campaign(campaign_id, dispatcher.remaining, failed)
+
 async def schedule(request):
     """
     Schedules the emails to be sent for a proper TOTP key.
     """
     data = await request.post()
-    template_data = decode_template_data(
-        data['template_data'].file.read().decode('utf-8')
-    )
-    template_data = reformat_input_data(template_data)
+    timer = StageTimer()
+    with timer.stage('decode'):
+        template_data = decode_template_data(
+            data['template_data'].file.read().decode('utf-8')
+        )
+    with timer.stage('reformat'):
+        template_data = reformat_input_data(template_data)
     response = None
-    # Generate a one-time password
-    otp = gen_otp_from_secret_file(request.app.get('secret_path'))
-    if data['password'] == otp:
-        emails = await request.app.get('book').read_emails()
-        for mail_hash, email in emails.items():
-            unsubscribe_url = None
-            if request.app['config'].check_list_unsubscribe_mode():
-                unsubscribe_url = request.app['config'].get_site_url() + \
-                                  '/unsubscribe/hash/' + \
-                                  mail_hash
-                template_data['unsubscribe_url'] = unsubscribe_url
-            mail_str = await Renderer(MAIL_TEMPLATE_PATH).render_template(template_data)
-            try:
-                await send_mail_async(
-                    request.app['config'].get_email_from(),
-                    email,
-                    template_data['title'] + ': ' + template_data['date'],
-                    mail_str,
-                    mail_params=request.app['config'].get_smtp(),
-                    list_unsubscribe=unsubscribe_url
-                )
-            except SMTPException as smtp_exc:
-                exception(smtp_exc)
-                error(f'Unable to send mail to {email}')
-            await sleep(1)
-        response = web.Response(text='Scheduled', status=200)
+    # A dry run doesn't use up the key of the real campaign
+    scope = 'dry_run' if 'dry_run' in data else 'schedule'
+    if request.app['totp'].verify(data['password'], scope):
+        if 'dry_run' in data:
+            return await dry_run(request, data, template_data, timer)
+        try:
+            send_at = parse_time(data.get('send_at'))
+            window_end = parse_time(data.get('window_end'))
+        except ValueError:
+            return web.Response(text='Incorrect delivery time', status=400)
+        if send_at is None and window_end is None:
+            await send_campaign(request.app, template_data)
+            return web.Response(text='Scheduled', status=200)
+        send_at = send_at or time()
+        if window_end is not None and window_end <= send_at:
+            return web.Response(text='Incorrect delivery window', status=400)
+        campaign_id = request.app['scheduler'].add(template_data, send_at, window_end)
+        response = web.Response(text=f'Scheduled: {campaign_id}', status=200)
     else:
         response = web.Response(text='Unable to send emails', status=403)
         warning(f'Incorrect key: {request.remote}')
     return response
 
+async def dry_run(request, data, template_data: dict, timer: StageTimer):
+    """
+    Runs a dry-run campaign for the "dry_run" field of the schedule request.
+
+    Form fields:
+        dry_run: "mbox" or "maildir"
+        repeat: how many times to go through the address book, up to DRY_RUN_MAX_REPEAT
+    """
+    try:
+        repeat = int(data.get('repeat', 1))
+    except ValueError:
+        repeat = 0
+    if data['dry_run'] not in SINKS or not 0 < repeat <= DRY_RUN_MAX_REPEAT:
+        return web.Response(text='Incorrect dry run options', status=400)
+    report = await dry_run_campaign(
+        request.app, template_data, data['dry_run'], timer, repeat
+    )
+    info(f'Dry run: {report}')
+    return web.json_response(report)
+
+async def campaign_status(request):
+    """
+    Reports the state of a scheduled or a recent campaign.
+    The route isn't protected with the TOTP key to be polled,
+    so it only tells the state, the schedule and the counters are kept private.
+
+    Returns:
+
+        web.Response: a JSON report, status 404 for an unknown campaign
+    """
+    campaign_id = request.match_info['campaign_id']
+    # A started campaign stays scheduled to be resumed after a restart
+    progress = request.app['mailing'].progress.get(campaign_id)
+    if progress is not None:
+        return web.json_response({'state': progress.state})
+    if campaign_id in request.app['scheduler'].campaigns:
+        return web.json_response({'state': 'scheduled'})
+    return web.json_response({'state': 'unknown'}, status=404)
+
 async def generate_print(request):
     """
     Generates a print template provided a proper TOTP key.
+    The result is streamed while it's rendered, compressed if the client accepts it.
     """
     data = await request.post()
     template_data = decode_template_data(
@@ -132,28 +394,103 @@ async def generate_print(request):
     )
     template_data = reformat_input_data(template_data)
     response = None
-    # Generate a one-time password to compare against the provided one
-    otp = gen_otp_from_secret_file(request.app.get('secret_path'))
     # Compare the OTP, render data if it's the same,
     # show an error otherwise
-    if data['password'] == otp:
-        render_str = await Renderer(PRINT_TEMPLATE_PATH).render_template(template_data)
-        response = web.Response(text=render_str, status=200)
+    if request.app['totp'].verify(data['password'], 'print'):
+        response = await send_stream(
+            request, Renderer(PRINT_TEMPLATE_PATH).stream_template(template_data)
+        )
     else:
         response = web.Response(text='Unable to generate the text', status=403)
         warning(f'Incorrect key: {request.remote}')
     return response
 
+async def profile(request):
+    """
+    Captures a CPU profile of the running server provided a proper TOTP key.
+
+    Form fields:
+        password: the TOTP key
+        seconds: profiling duration, up to PROFILE_MAX_SECONDS
+        format: "pstats" (default) or "collapsed"
+    """
+    data = await request.post()
+    if not request.app['totp'].verify(data.get('password', ''), 'profile'):
+        warning(f'Incorrect key: {request.remote}')
+        return web.Response(text='Unable to profile', status=403)
+    profile_format = data.get('format', 'pstats')
+    try:
+        seconds = float(data.get('seconds', PROFILE_DEFAULT_SECONDS))
+    except ValueError:
+        seconds = -1
+    if profile_format not in PROFILE_FORMATS or not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return web.Response(text='Incorrect profiling options', status=400)
+    # cProfile can't run twice, and two samplers would skew each other
+    if request.app['profiling']['active']:
+        return web.Response(text='Profiling is already running', status=409)
+    request.app['profiling']['active'] = True
+    try:
+        profile_data = await capture_profile(seconds, profile_format)
+    finally:
+        request.app['profiling']['active'] = False
+    return web.Response(
+        body=profile_data,
+        content_type='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename="mailer.{profile_format}"'}
+    )
+
+async def warmup_templates(_):
+    """
+    Precompile the templates before the first request arrives.
+    """
+    for template_path, template_files in WARMUP_TEMPLATES.items():
+        warmup(template_path, template_files)
+
+async def start_scheduler(app):
+    """
+    Start the delayed campaigns scheduler.
+    """
+    app['scheduler'].start()
+
+async def stop_scheduler(app):
+    """
+    Stop the delayed campaigns scheduler.
+    """
+    await app['scheduler'].stop()
+
+async def start_monitoring(app):
+    """
+    Start the event loop lag sampling.
+    """
+    app['loop_monitor'].start()
+
+async def register_reload_signal(app):
+    """
+    Reload the configuration and the templates on SIGHUP.
+    """
+    get_running_loop().add_signal_handler(SIGHUP, reload_config, app)
+
+async def stop_monitoring(app):
+    """
+    Stop the event loop lag sampling.
+    """
+    await app['loop_monitor'].stop()
+
 def register_routes(app):
     """
     Register the AioHTTP routes.
     """
     app.add_routes([
         web.get('/', index),
+        web.get('/healthz', healthz),
+        web.get('/readyz', readyz),
         web.get('/unsubscribe/hash/{hash}', unsubscribe_by_hash),
         web.post('/subscribe', subscribe),
         web.post('/generate_print', generate_print),
-        web.post('/schedule', schedule)
+        web.post('/schedule', schedule),
+        web.get('/campaigns/{campaign_id}', campaign_status),
+        web.post('/profile', profile),
+        web.post('/reload', reload)
     ])
 
 def main():
@@ -172,12 +509,32 @@ def main():
     # Initialise the application
     app = web.Application()
     app['book'] = book
-    app['config'] = config
-    app['secret_path'] = args.secret_path
+    app['live'] = {'config': config}
+    app['config_path'] = args.config_path
+    app['totp'] = TOTPVerifier(args.secret_path, **config.get_totp_options())
+    app['mailing'] = MailingState()
+    app['loop_monitor'] = LoopLagMonitor(**config.get_monitor_options())
+    app['profiling'] = {'active': False}
+    app['scheduler'] = CampaignScheduler(
+        lambda template_data, window_end, campaign_id, **resume: send_campaign(
+            app, template_data, window_end, campaign_id, **resume
+        ),
+        args.schedule_path
+    )
     # Initialise logging
     basicLoggingConfig(level=LOGGING_INFO)
     # Add application routes
     register_routes(app)
+    # Track the event loop lag for the readiness probe
+    app.on_startup.append(start_monitoring)
+    app.on_cleanup.append(stop_monitoring)
+    app.on_startup.append(register_reload_signal)
+    # Start the delayed campaigns, including the ones saved before a restart
+    app.on_startup.append(start_scheduler)
+    app.on_cleanup.append(stop_scheduler)
+    # Compile the templates on startup instead of the first request
+    if config.check_warmup_mode():
+        app.on_startup.append(warmup_templates)
     # Start the server
     web.run_app(app, **config.get_server_options())
 
@@ -0,0 +1,88 @@
+"""
+Streaming HTTP responses with the compression negotiated by Accept-Encoding.
+"""
+
+from aiohttp import web
+from aiohttp.web import ContentCoding
+
+# The supported encodings, in the order of preference
+ENCODINGS = ('br', 'gzip', 'deflate')
+
+def parse_accept_encoding(accept_encoding: str):
+    """
+    Returns:
+        (dict): the encodings as keys, their q-values as values
+    """
+    qualities = {}
+    for item in accept_encoding.lower().split(','):
+        encoding, *params = [part.strip() for part in item.split(';')]
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[encoding] = quality
+    return qualities
+
+def choose_encoding(accept_encoding: str):
+    """
+    Pick the encoding with the highest q-value, the ones with q=0 are refused.
+    A "*" applies to the encodings which aren't listed.
+
+    Returns:
+        (str / None): "br", "gzip", "deflate" or None for an uncompressed response
+    """
+    qualities = parse_accept_encoding(accept_encoding)
+    default = qualities.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+async def send_stream(request, chunks, content_type: str = 'text/html'):
+    """
+    Send the text chunks as a chunked response, compressing them
+    with Brotli, gzip or deflate if the client accepts it.
+
+    Args:
+        request (web.Request): the request to answer
+        chunks (async iterator): the response text parts
+        content_type (str): the response content type
+
+    Returns:
+        (web.StreamResponse): the finished response
+    """
+    response = web.StreamResponse(status=200)
+    response.content_type = content_type
+    response.charset = 'utf-8'
+    # The body depends on Accept-Encoding whichever encoding is chosen,
+    # so the caches in front of the server keep a copy per encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    compressor = None
+    if encoding == 'br':
+        # Brotli is only needed by this response
+        # pylint: disable=C0415
+        from brotli import Compressor, MODE_TEXT
+        compressor = Compressor(mode=MODE_TEXT)
+        response.headers['Content-Encoding'] = 'br'
+    elif encoding:
+        response.enable_compression(ContentCoding(encoding))
+    await response.prepare(request)
+    async for chunk in chunks:
+        data = chunk.encode('utf-8')
+        if compressor:
+            data = compressor.process(data)
+        if data:
+            await response.write(data)
+    if compressor:
+        await response.write(compressor.finish())
+    await response.write_eof()
+    return response
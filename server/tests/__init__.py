@@ -0,0 +1,3 @@
+"""
+Server tests, run with pytest from the server directory.
+"""
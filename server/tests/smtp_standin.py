@@ -0,0 +1,123 @@
+"""
+A local SMTP stand-in, accepting the mails without delivering them.
+"""
+
+from asyncio import start_server, sleep
+
+# pylint: disable=R0902
+class ThrottlingSMTPServer:
+    """
+    An SMTP server which can throttle the recipient domains.
+
+    A throttled domain answers "421" to its first recipients,
+    like a mail provider limiting the incoming connections.
+    The accepted recipients are recorded in the delivery order,
+    and the concurrent deliveries are counted per domain.
+    """
+
+    def __init__(self, throttle: dict = None, delay: float = 0.0, delays: dict = None):
+        """
+        Args:
+            throttle (dict): domains as keys, the amount of their first recipients
+                             answered with "421" as values
+            delay (float): seconds to hold each message before accepting it,
+                           so that the concurrent deliveries overlap
+            delays (dict): domains as keys, their own delays as values
+        """
+        self.throttle = throttle or {}
+        self.delay = delay
+        self.delays = delays or {}
+        self.throttled = {}
+        self.delivered = []
+        self.active = {}
+        self.peak = {}
+        self.peak_total = 0
+        self.server = None
+        self.port = None
+
+    async def __aenter__(self):
+        self.server = await start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *_):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def get_mail_params(self):
+        """
+        Returns:
+            (dict): the SMTP configuration pointing to the stand-in
+        """
+        return {'host': '127.0.0.1', 'port': self.port}
+
+    def get_domains(self):
+        """
+        Returns:
+            (list): the domains of the delivered mails, in the delivery order
+        """
+        return [domain for domain, _ in self.delivered]
+
+    def accept_recipient(self, email: str):
+        """
+        Returns:
+            (bytes): the RCPT reply, "421" while the domain is throttled
+        """
+        domain = email.rpartition('@')[2].lower()
+        if self.throttled.get(domain, 0) < self.throttle.get(domain, 0):
+            self.throttled[domain] = self.throttled.get(domain, 0) + 1
+            return b'421 Too many connections, try again later\r\n'
+        self.delivered.append((domain, email))
+        self.active[domain] = self.active.get(domain, 0) + 1
+        self.peak[domain] = max(self.peak.get(domain, 0), self.active[domain])
+        self.peak_total = max(self.peak_total, sum(self.active.values()))
+        return b'250 OK\r\n'
+
+    def finish_delivery(self, email: str):
+        """
+        Stop counting a delivery as active.
+        """
+        domain = email.rpartition('@')[2].lower()
+        self.active[domain] -= 1
+
+    async def handle(self, reader, writer):
+        """
+        Serve a single SMTP session.
+        """
+        recipient = None
+        reading_data = False
+        writer.write(b'220 localhost SMTP stand-in\r\n')
+        try:
+            while line := await reader.readline():
+                if reading_data:
+                    if line == b'.\r\n':
+                        reading_data = False
+                        domain = recipient.rpartition('@')[2].lower()
+                        await sleep(self.delays.get(domain, self.delay))
+                        self.finish_delivery(recipient)
+                        recipient = None
+                        writer.write(b'250 OK\r\n')
+                        await writer.drain()
+                    continue
+                command = line[:4].upper()
+                if command in (b'EHLO', b'HELO'):
+                    writer.write(b'250 localhost\r\n')
+                elif command == b'RCPT':
+                    email = line.decode('ascii').partition('<')[2].partition('>')[0]
+                    reply = self.accept_recipient(email)
+                    if reply.startswith(b'250'):
+                        recipient = email
+                    writer.write(reply)
+                elif command == b'DATA':
+                    reading_data = True
+                    writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                elif command == b'QUIT':
+                    writer.write(b'221 Bye\r\n')
+                    break
+                else:
+                    writer.write(b'250 OK\r\n')
+                await writer.drain()
+        finally:
+            if recipient:
+                self.finish_delivery(recipient)
+            writer.close()
@@ -0,0 +1,133 @@
+"""
+Dispatcher tests against the throttling SMTP stand-in.
+"""
+
+from asyncio import run, get_running_loop
+from dispatcher import Dispatcher
+from monitor import MailingState
+from sender import send_mail_async
+from tests.smtp_standin import ThrottlingSMTPServer
+
+def get_emails(*domains, per_domain: int = 3):
+    """
+    Returns:
+        (dict): an address book with the domains following each other
+    """
+    return {
+        f'{domain}-{index}': f'user{index}@{domain}'
+        for domain in domains
+        for index in range(per_domain)
+    }
+
+def dispatch(smtp: ThrottlingSMTPServer, emails: dict, **options):
+    """
+    Send a campaign through the stand-in.
+
+    Returns:
+        (tuple): the dispatcher, the campaign progress
+                 and the (domain, time) pairs of the started sends
+    """
+    started = []
+
+    async def campaign():
+        async with smtp:
+            mail_params = smtp.get_mail_params()
+
+            async def send(_, email: str):
+                started.append((email.rpartition('@')[2], get_running_loop().time()))
+                await send_mail_async(
+                    'news@example.org', email, 'News', '<p>News</p>', mail_params=mail_params
+                )
+
+            dispatcher = Dispatcher(send, **options)
+            progress = MailingState().start_campaign('test', len(emails))
+            await dispatcher.run(emails, progress)
+            return dispatcher, progress, started
+
+    return run(campaign())
+
+def test_domains_interleave():
+    """
+    The domains take turns even if the address book is sorted by domain.
+    """
+    smtp = ThrottlingSMTPServer()
+    _, progress, _ = dispatch(
+        smtp, get_emails('a.org', 'b.org', 'c.org'), concurrency=1, domain_interval=0
+    )
+    assert smtp.get_domains() == ['a.org', 'b.org', 'c.org'] * 3
+    assert progress.sent == 9
+
+def test_domain_concurrency():
+    """
+    The parallel sends are limited per domain and in total.
+    """
+    smtp = ThrottlingSMTPServer(delay=0.05)
+    dispatch(
+        smtp, get_emails('a.org', 'b.org', 'c.org', per_domain=6),
+        concurrency=4, domain_concurrency=2, domain_interval=0,
+        domains={'c.org': {'concurrency': 1}}
+    )
+    assert smtp.peak == {'a.org': 2, 'b.org': 2, 'c.org': 1}
+    assert smtp.peak_total <= 4
+
+def test_domain_interval():
+    """
+    The sends to a domain are spaced by its interval,
+    while the other domains aren't held back.
+    """
+    smtp = ThrottlingSMTPServer()
+    _, _, started = dispatch(
+        smtp, get_emails('a.org', 'b.org'),
+        domain_interval=0.2, domains={'b.org': {'interval': 0.1}}
+    )
+    send_times = {
+        domain: [sent_at for sent_domain, sent_at in started if sent_domain == domain]
+        for domain in ('a.org', 'b.org')
+    }
+    for domain, interval in (('a.org', 0.2), ('b.org', 0.1)):
+        times = send_times[domain]
+        assert len(times) == 3
+        assert all(later - earlier >= interval * 0.9 for earlier, later in zip(times, times[1:]))
+    # The last b.org mail is sent before the last a.org one
+    assert send_times['b.org'][-1] < send_times['a.org'][-1]
+
+def test_domain_interval_with_busy_slots():
+    """
+    The interval is kept between the actual sends to a domain
+    when its workers wait for the busy global slots.
+    """
+    domains = ('a.org', 'b.org', 'c.org', 'd.org', 'e.org')
+    smtp = ThrottlingSMTPServer(delay=0.01, delays={'a.org': 0.3, 'b.org': 0.15})
+    _, progress, started = dispatch(
+        smtp, get_emails(*domains), concurrency=2, domain_interval=0.2
+    )
+    assert progress.sent == 15
+    for domain in domains:
+        times = [sent_at for sent_domain, sent_at in started if sent_domain == domain]
+        assert min(later - earlier for earlier, later in zip(times, times[1:])) >= 0.18
+
+def test_throttled_recipient_is_requeued():
+    """
+    A recipient refused with "421" is sent again later.
+    """
+    smtp = ThrottlingSMTPServer(throttle={'y.org': 2})
+    dispatcher, progress, _ = dispatch(
+        smtp, get_emails('x.org', per_domain=2) | get_emails('y.org', per_domain=1),
+        domain_interval=0, max_attempts=3, retry_delay=0.01
+    )
+    assert smtp.throttled == {'y.org': 2}
+    assert sorted(smtp.get_domains()) == ['x.org', 'x.org', 'y.org']
+    assert (progress.sent, progress.failed, dispatcher.remaining) == (3, 0, 0)
+
+def test_throttled_recipient_fails_after_max_attempts():
+    """
+    A recipient is given up after max_attempts, the other ones are still sent.
+    """
+    smtp = ThrottlingSMTPServer(throttle={'y.org': 100})
+    dispatcher, progress, _ = dispatch(
+        smtp, get_emails('x.org', per_domain=2) | get_emails('y.org', per_domain=1),
+        domain_interval=0, max_attempts=3, retry_delay=0.01
+    )
+    assert smtp.throttled == {'y.org': 3}
+    assert smtp.get_domains() == ['x.org', 'x.org']
+    assert (progress.sent, progress.failed, dispatcher.remaining) == (2, 1, 0)
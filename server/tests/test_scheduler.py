@@ -0,0 +1,60 @@
+"""
+Scheduled campaign persistence tests.
+"""
+
+from time import time
+from json import load
+from asyncio import run, sleep, Event
+from scheduler import CampaignScheduler, SENT_SAVE_INTERVAL
+
+# The address book of the test campaigns
+EMAILS = [f'hash-{index}' for index in range(SENT_SAVE_INTERVAL * 2)]
+
+def test_interrupted_campaign_is_resumed(tmp_path):
+    """
+    A campaign interrupted by a shutdown stays in the schedule file
+    and is resumed with the subscribers it wasn't sent to.
+    """
+    state_path = str(tmp_path / 'schedule.json')
+    calls = []
+    interrupted = Event()
+
+    async def start_campaign(*_, sent, on_sent):
+        calls.append(set(sent))
+        for mail_hash in EMAILS:
+            if mail_hash in sent:
+                continue
+            on_sent(mail_hash)
+            if len(calls) == 1 and mail_hash == EMAILS[SENT_SAVE_INTERVAL + 2]:
+                interrupted.set()
+                # Wait to be cancelled by the shutdown
+                await sleep(60)
+
+    async def first_run():
+        scheduler = CampaignScheduler(start_campaign, state_path)
+        scheduler.start()
+        campaign_id = scheduler.add({'title': 'News'}, time())
+        await interrupted.wait()
+        # The progress is saved periodically while the campaign is running
+        with open(state_path, 'r', encoding='utf-8') as state_file:
+            assert len(load(state_file)[campaign_id]['sent']) == SENT_SAVE_INTERVAL
+        await scheduler.stop()
+        return campaign_id
+
+    async def second_run():
+        scheduler = CampaignScheduler(start_campaign, state_path)
+        scheduler.start()
+        assert scheduler.get_pending() == 0
+        while scheduler.campaigns:
+            await sleep(0.01)
+        await scheduler.stop()
+
+    campaign_id = run(first_run())
+    with open(state_path, 'r', encoding='utf-8') as state_file:
+        campaign = load(state_file)[campaign_id]
+    assert campaign['started']
+    assert campaign['sent'] == EMAILS[:SENT_SAVE_INTERVAL + 3]
+    run(second_run())
+    assert calls == [set(), set(EMAILS[:SENT_SAVE_INTERVAL + 3])]
+    with open(state_path, 'r', encoding='utf-8') as state_file:
+        assert not load(state_file)
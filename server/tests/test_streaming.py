@@ -0,0 +1,23 @@
+"""
+Accept-Encoding negotiation tests.
+"""
+
+from pytest import mark
+from streaming import choose_encoding
+
+@mark.parametrize('accept_encoding, encoding', [
+    ('', None),
+    ('identity', None),
+    ('gzip, deflate, br', 'br'),
+    ('GZIP', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('gzip;q=0, identity', None),
+    ('gzip;q=0.5, deflate', 'deflate'),
+    ('br;q=0, *', 'gzip'),
+    ('*;q=0', None),
+])
+def test_choose_encoding(accept_encoding: str, encoding: str):
+    """
+    The encoding with the highest q-value is chosen, q=0 refuses an encoding.
+    """
+    assert choose_encoding(accept_encoding) == encoding
@@ -6,21 +6,32 @@ https://github.com/tadeck/onetimepass (MIT)
 https://stackoverflow.com/a/8549884/703462
 """
 
-from hmac import new as hmac_new
+from os import stat
+from collections import OrderedDict
+from logging import info, warning
+from hmac import new as hmac_new, compare_digest
 from base64 import b32decode, b32encode
 from struct import pack, unpack
 from hashlib import sha1
-from time import gmtime
+from time import gmtime, time
 from calendar import timegm
 from random import randint
 
+# TOTP time step in seconds
+TIME_STEP = 30
+
 def get_hotp_token(secret, intervals_no):
     """
     HMAC-based One-Time Password generator, which is changed with each call,
     in compliance to RFC4226.
     """
-    key = b32decode(secret, True)
     # Decoding our key
+    return get_hotp_value(b32decode(secret, True), intervals_no)
+
+def get_hotp_value(key: bytes, intervals_no: int):
+    """
+    HOTP generator for an already decoded key.
+    """
     msg = pack(">Q", intervals_no)
     # Conversions between Python values and C structs representation
     h = hmac_new(key, msg, sha1).digest()
@@ -39,7 +50,16 @@ def get_totp_token(secret: str):
         token = get_totp_token(secret)
     """
     # Ensuring to give the same otp for 30 seconds
-    x = str(get_hotp_token(secret, intervals_no=int(timegm(gmtime()))//30))
+    return format_token(
+        get_hotp_token(secret, intervals_no=int(timegm(gmtime()))//TIME_STEP)
+    )
+
+def format_token(value: int):
+    """
+    Format a HOTP value as a 6-digit key.
+    The padding is kept compatible with the CI side.
+    """
+    x = str(value)
     # Adding 0 in the beginning until OTP has 6 digits
     while len(x) != 6:
         x += '0'
@@ -60,3 +80,72 @@ def gen_otp_from_secret_file(secret_path: str):
     with open(secret_path, 'r', encoding='ascii') as secret_file:
         secret = secret_file.read()
     return get_totp_token(secret)
+
+class TOTPVerifier:
+    """
+    TOTP key verifier.
+
+    The secret is read and decoded once, and again only when the file changes.
+    The keys of the neighbouring time steps are accepted to tolerate a clock skew.
+    A key accepted once is rejected afterwards within the same scope,
+    so that an intercepted request can't be replayed.
+    """
+
+    def __init__(self, secret_path: str, window: int = 1, replay_cache_size: int = 64):
+        """
+        Args:
+            secret_path (str): a path to the secret file
+            window (int): the amount of time steps to accept before and after the current one
+            replay_cache_size (int): the amount of the used keys to remember
+        """
+        self.secret_path = secret_path
+        self.window = window
+        self.replay_cache_size = replay_cache_size
+        self.key = None
+        self.mtime = None
+        self.used = OrderedDict()
+
+    def load_key(self):
+        """
+        Returns:
+            (bytes): the decoded secret, re-read if the file has changed
+        """
+        mtime = stat(self.secret_path).st_mtime_ns
+        if mtime != self.mtime:
+            with open(self.secret_path, 'r', encoding='ascii') as secret_file:
+                self.key = b32decode(secret_file.read().strip(), True)
+            if self.mtime is not None:
+                info('The TOTP secret was reloaded')
+            self.mtime = mtime
+        return self.key
+
+    def verify(self, token: str, scope: str = ''):
+        """
+        Check a TOTP key.
+
+        Args:
+            token (str): the key to check
+            scope (str): the action the key is used for;
+                         a key can be used once per scope
+
+        Returns:
+            (Boolean) True if the key is correct and wasn't used before
+        """
+        key = self.load_key()
+        token = str(token).encode('utf-8')
+        current_step = int(time()) // TIME_STEP
+        matched_step = None
+        # Every step of the window is compared to keep the check time constant
+        for step in range(current_step - self.window, current_step + self.window + 1):
+            candidate = format_token(get_hotp_value(key, step)).encode('ascii')
+            if compare_digest(candidate, token):
+                matched_step = step
+        if matched_step is None:
+            return False
+        if (scope, matched_step) in self.used:
+            warning(f'Replayed TOTP key for "{scope}"')
+            return False
+        self.used[(scope, matched_step)] = True
+        while len(self.used) > self.replay_cache_size:
+            self.used.popitem(last=False)
+        return True